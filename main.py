@@ -4,23 +4,29 @@
 Comprehensive script to:
 1. Create/Update an AI assistant with File Search enabled.
 2. Upload and process documents (Word, PDF, TXT, MD) into a vector store.
-3. Answer 20 questions iteratively, prioritizing information based on authority ranking.
+3. Answer 20 questions concurrently, prioritizing information based on authority ranking.
 4. Generate a JSON summary table of the findings.
 
 Focus on accuracy of extraction using OpenAI Assistant API. Handles token limits by iterative processing.
 """
 
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import asyncio
+import functools
+import hashlib
+import httpx
 import os
-import time
+import re
+import sqlite3
 import json
-import tempfile
-from typing import List, Dict
-from openai import OpenAI, AssistantEventHandler
+import orjson
+from pathlib import Path
+from typing import List, Dict, Optional
+from openai import OpenAI, AsyncOpenAI, AsyncAssistantEventHandler, DefaultAsyncHttpxClient, NotFoundError
 from openai.types.beta.threads.runs import ToolCallDeltaObject
 from typing_extensions import override
-from docx import Document  # For handling Word documents
 
 # Configuration
 HOA_DOCS_DIR = "./input/hoa_documents"  # Path to your HOA documents
@@ -29,8 +35,22 @@ ASSISTANT_NAME = "HOA Document Analyzer"
 VECTOR_STORE_NAME = "HOA Documents"
 TEMPERATURE = 0.1  # Lower temperature for higher accuracy.  Keep it low, e.g., 0.0-0.2
 MAX_RETRIES = 3 # Number of retries for API calls
-RETRY_DELAY = 5 # Delay (in seconds) between retries
+REQUEST_TIMEOUT = 60.0 # Timeout (in seconds) for a single API request
+HTTP_MAX_CONNECTIONS = 32 # Connection pool size for the async client used by concurrent runs
+MAX_CONCURRENT_RUNS = 8 # Number of assistant runs in flight at once
+QUESTIONS_PER_RUN = 5 # Number of questions answered together in one assistant run
+FILE_SEARCH_RESULTS_PER_QUESTION = 3 # Top reranked chunks kept per question in a run
+FILE_SEARCH_MAX_RESULTS = min(FILE_SEARCH_RESULTS_PER_QUESTION * QUESTIONS_PER_RUN, 50) # Per-search cap for a whole batch (15, below the gpt-4o default of 20); 50 is the API maximum
+FILE_SEARCH_RANKER = "default_2024_08_21" # Pinned explicitly so results don't shift if "auto" changes; it is what "auto" picks today
+FILE_SEARCH_SCORE_THRESHOLD = 0.0 # Keep every reranked chunk; raise only after checking answers don't fall back to "No relevant data found"
+MAX_CONCURRENT_UPLOADS = 8 # Number of files uploaded in parallel
+FILE_BATCH_LIMIT = 100 # Maximum number of files attached to a vector store in one batch
+FILE_BATCH_POLL_INTERVAL_MS = 1000 # How often to check whether a file batch has finished processing
 OUTPUT_DIR = "./output"
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, "manifest.json")  # Filename + content digest -> uploaded file ID, so unchanged documents are not re-uploaded
+RESPONSE_CACHE_PATH = os.path.join(OUTPUT_DIR, "response_cache.sqlite3")  # Answers reused when documents and prompt are unchanged
+OPENAI_IDS_FILE = os.path.join(OUTPUT_DIR, ".openai_ids.json")  # Remembers the assistant and vector store between runs
+ALLOWED_EXTENSIONS = frozenset({'.doc', '.docx', '.pdf', '.txt', '.md'})  # Document types File Search can parse
 
 AUTHORITY_RANKING = {
     "CC&R Amendments": 1,
@@ -74,121 +94,230 @@ EXTRACTION_QUESTIONS = [
     "What evidence or information is provided about resident engagement, involvement, or feedback within the community? (If multiple sources offer information on resident engagement, use the details from the highest-ranked document.)",
 ]
 
-client = OpenAI()
+# Filename aliases per category; a file matches an alias when every word of it appears as a whole filename token
+CATEGORY_ALIASES = {
+    "CC&R Amendments": ["ccr amendment", "amended ccr", "declaration amendment", "amended declaration"],
+    "CC&Rs": ["ccr", "declaration", "covenant condition restriction"],
+    "Bylaws": ["bylaw", "by law"],
+    "Articles of Incorporation": ["article incorporation", "incorporation"],
+    "Operating Rules": ["operating rule", "rule regulation", "house rule"],
+    "Election Rules": ["election rule", "election"],
+    "Annual Budget Report": ["budget"],
+    "Financial Statements": ["financial statement", "financial", "balance sheet", "audit"],
+    "Reserve Study": ["reserve study"],
+    "Reserve Fund": ["reserve fund", "reserve"],
+    "Fine Schedule": ["fine schedule", "fine"],
+    "Assessment Enforcement": ["assessment enforcement", "collection policy", "collection"],
+    "Meeting Minutes": ["meeting minute", "minute"],
+    "Additional Operational Policies & Guidelines": ["policy", "guideline"],
+    "Insurance & Evidence of Insurance (COI)": ["insurance", "coi", "certificate insurance", "evidence insurance"],
+    "Flood & General Liability Insurance": ["flood", "flood insurance", "liability insurance", "general liability insurance"],
+}
+# Words that appear in many document names ("Master Insurance Policy"); they only decide a category when nothing more specific matches
+GENERIC_ALIASES = frozenset({"policy", "guideline"})
+FILENAME_STOP_WORDS = frozenset({"a", "an", "and", "the", "of", "for", "to", "in", "hoa", "final", "copy", "draft"})
+
+AUTHORITY_RANKING_JSON = json.dumps(AUTHORITY_RANKING, indent=2)
+
+ASSISTANT_INSTRUCTIONS = f"""
+You are an expert in HOA documents. Accuracy is extremely important.
+When answering, always extract information directly from the provided documents.
+If using file search, return the most relevant sections word-for-word and cite the document name.
+If no relevant information is found, explicitly state: 'No relevant data found in the uploaded documents.'
+Do NOT answer from general knowledge—only use the retrieved documents.
+
+Use this Authority Ranking to prioritize information sources (1 is highest priority):
+{AUTHORITY_RANKING_JSON}
+
+When multiple documents contain relevant information, always prioritize information from the highest-ranked source.
+Include the source document name in your response.
+
+Please address the user as Corbin. The user has a premium account.
+Use file search to find relevant information.
+Prioritize extracting information from the highest-ranked document according to the Authority Ranking.
+Provide both a detailed answer and a brief summary for every question.
+Be extremely accurate.
+Answer the questions in order. Format the response for each question as:
+QUESTION <number>:
+DETAILED ANSWER:
+[Your detailed response here]
+
+SUMMARY:
+[Your brief summary here]
+"""
 
-class EventHandler(AssistantEventHandler):
+# Section headers in batched answers: "QUESTION 2:", "**Question 2:**", "### Question 2" ...
+QUESTION_MARKER = re.compile(r"^[#*\s]*QUESTION\s*(\d+)\**\s*(?:[:.)]\**|$)", re.IGNORECASE | re.MULTILINE)
+SUMMARY_MARKER = re.compile(r"^[#*\s]*SUMMARY\**\s*(?::\**|$)", re.IGNORECASE | re.MULTILINE)
+DETAILED_MARKER = re.compile(r"^[#*\s]*DETAILED ANSWER\**\s*(?::\**|$)", re.IGNORECASE | re.MULTILINE)
+
+FILENAME_CACHE: Dict[str, str] = {}  # File ID -> filename, pre-warmed after upload
+
+# The SDK retries rate limits, 5xx responses, connection errors and timeouts with exponential backoff and jitter
+client = OpenAI(max_retries=MAX_RETRIES, timeout=REQUEST_TIMEOUT)
+# One explicitly sized pool shared by all concurrent runs; HTTP/2 multiplexes them over few connections
+aclient = AsyncOpenAI(
+    max_retries=MAX_RETRIES,
+    timeout=REQUEST_TIMEOUT,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS),
+        http2=True,
+    ),
+)
+
+async def filename_for(aclient: AsyncOpenAI, file_id: str) -> str:
+    """Resolves a file ID to its filename, retrieving it only on a cache miss."""
+    if file_id not in FILENAME_CACHE:
+        file = await aclient.files.retrieve(file_id)
+        FILENAME_CACHE[file_id] = file.filename
+    return FILENAME_CACHE[file_id]
+
+
+class EventHandler(AsyncAssistantEventHandler):
+    """Keeps the run's final message; citations are read from it once the run is done."""
     def __init__(self):
-        self.response_content = ""
-        self.source_documents = set()
+        super().__init__()
+        self.final_message = None
 
     @override
-    def on_tool_call_created(self, tool_call):
+    async def on_tool_call_created(self, tool_call):
         print(f"\nTool called: {tool_call.type}", flush=True)
 
     @override
-    def on_text_created(self, text):
-        self.response_content += text.value + "\n"
-        
-    @override
-    def on_file_citation_created(self, file_citation):
-        try:
-            file = client.files.retrieve(file_citation.file_id)
-            self.source_documents.add(file.filename)
-        except Exception as e:
-            print(f"Error retrieving file citation: {e}")
-
-    @override
-    def on_message_done(self, message):
+    async def on_message_done(self, message):
+        self.final_message = message
         print("\nMessage completed", flush=True)
 
-def read_word_document(file_path: str) -> str:
-    """Reads a Word document and returns its text content."""
-    try:
-        document = Document(file_path)
-        return "\n".join(paragraph.text for paragraph in document.paragraphs)
-    except Exception as e:
-        print(f"Error reading Word document {file_path}: {e}")
+async def stream_run(aclient: AsyncOpenAI, **kwargs) -> EventHandler:
+    """Starts a run and streams its events through an EventHandler, returned once the run ends."""
+    handler = EventHandler()
+    async with aclient.beta.threads.runs.stream(event_handler=handler, **kwargs) as stream:
+        await stream.until_done()
+    return handler
+
+def filename_tokens(name: str) -> List[str]:
+    """Splits a filename into lowercase, singularised words ("CC&Rs_Amended.pdf" -> ["ccr", "amended", "pdf"])."""
+    name = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", name).lower().replace("&", "")
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", name):
+        if token.endswith("ies") and len(token) > 4:
+            token = token[:-3] + "y"
+        elif token.endswith("s") and not token.endswith("ss") and len(token) > 3:
+            token = token[:-1]
+        if token not in FILENAME_STOP_WORDS:
+            tokens.append(token)
+    return tokens
+
+def authority_category(file_path: str) -> Optional[str]:
+    """Infers a document's Authority Ranking category from its filename, or None if nothing matches."""
+    tokens = set(filename_tokens(os.path.splitext(os.path.basename(file_path))[0]))
+    best, best_key = None, None
+    for category, aliases in CATEGORY_ALIASES.items():
+        for alias in aliases:
+            words = filename_tokens(alias)
+            if all(word in tokens for word in words):
+                # Specific aliases beat generic ones, then the longest wins so "Reserve Study" beats "Reserve Fund";
+                # ties go to the higher authority
+                key = (alias not in GENERIC_ALIASES, len(words), -AUTHORITY_RANKING[category])
+                if best_key is None or key > best_key:
+                    best, best_key = category, key
+    return best
+
+def authority_rank(file_path: str) -> int:
+    """Returns the document's Authority Ranking; unrecognised documents rank below all known categories."""
+    category = authority_category(file_path)
+    return AUTHORITY_RANKING[category] if category else len(AUTHORITY_RANKING) + 1
+
+def document_ranking_instructions(file_paths: List[str]) -> str:
+    """Describes which uploaded file belongs to which Authority Ranking category; unrecognised files are left out."""
+    lines = []
+    for file_path in sorted(file_paths, key=lambda path: (authority_rank(path), os.path.basename(path))):
+        category = authority_category(file_path)
+        if category:
+            lines.append(f"- {os.path.basename(file_path)}: {category} (rank {AUTHORITY_RANKING[category]})")
+    if not lines:
         return ""
-
-def prepare_files(hoa_docs_dir: str) -> List[Dict[str, str]]:
-    """Prepares a list of files with their content, handling different file types."""
-    allowed_extensions = {'.doc', '.docx', '.pdf', '.txt', '.md'}
-    file_paths = [
-        os.path.join(hoa_docs_dir, filename)
-        for filename in os.listdir(hoa_docs_dir)
-        if os.path.isfile(os.path.join(hoa_docs_dir, filename))
-        and not filename.startswith("~$")  # Ignore temporary files
-        and os.path.splitext(filename)[1].lower() in allowed_extensions
-    ]
+    return "Uploaded documents and their Authority Ranking (1 is highest priority):\n" + "\n".join(lines)
+
+def assistant_instructions(file_paths: List[str]) -> str:
+    """The full instructions sent to the assistant for this set of documents."""
+    ranking = document_ranking_instructions(file_paths)
+    return ASSISTANT_INSTRUCTIONS + "\n" + ranking if ranking else ASSISTANT_INSTRUCTIONS
+
+def prepare_files(hoa_docs_dir: str) -> List[str]:
+    """Collects the paths of supported documents; File Search parses their contents server-side."""
+    with os.scandir(hoa_docs_dir) as entries:
+        file_paths = [
+            entry.path
+            for entry in entries
+            # Cheap name checks first so unsupported entries never need a stat
+            if os.path.splitext(entry.name)[1].lower() in ALLOWED_EXTENSIONS
+            and not entry.name.startswith("~$")  # Ignore temporary files
+            and entry.is_file()
+        ]
 
     if not file_paths:
         print("No valid files with supported extensions found for upload.")
         exit(1)
 
-    files_with_content = []
-    for file_path in file_paths:
-        try:
-            file_extension = os.path.splitext(file_path)[1].lower()
-            if file_extension in ['.doc', '.docx']:
-                content = read_word_document(file_path)
-            elif file_extension == '.pdf':
-                try:
-                    from PyPDF2 import PdfReader
-                    with open(file_path, 'rb') as f:
-                        reader = PdfReader(f)
-                        content = "".join(page.extract_text() for page in reader.pages)
-                except ImportError:
-                    print("PyPDF2 is not installed. Please install it to process PDF files.")
-                    content = ""
-                except Exception as e:
-                    print(f"Error reading PDF {file_path}: {e}")
-                    content = ""
-            else:  # .txt, .md
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-
-            if content:
-                files_with_content.append({"path": file_path, "content": content})
-            else:
-                print(f"Could not extract content from {file_path}")
-
-        except Exception as e:
-            print(f"Error processing {file_path}: {e}")
+    # Highest-authority documents first
+    return sorted(file_paths, key=authority_rank)
 
-    return files_with_content
+def load_cached_ids() -> Dict[str, str]:
+    """Reads the assistant and vector store IDs recorded by a previous run."""
+    try:
+        with open(OPENAI_IDS_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_cached_id(key: str, object_id: str) -> None:
+    """Records an assistant or vector store ID so the next run can retrieve it directly."""
+    cached_ids = load_cached_ids()
+    cached_ids[key] = object_id
+    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+    with open(OPENAI_IDS_FILE, "w") as f:
+        json.dump(cached_ids, f, indent=2)
 
 def create_or_update_assistant(client: OpenAI) -> any:
     """Creates a new Assistant or updates an existing one with File Search enabled."""
     try:
-        # List existing assistants without order_by parameter
-        assistants = client.beta.assistants.list()
-        
-        for asst in assistants.data:
-            if asst.name == ASSISTANT_NAME:
-                client.beta.assistants.delete(asst.id)
-                print(f"Deleted existing assistant with ID: {asst.id}")
-
-        # Create fresh assistant
-        assistant = client.beta.assistants.create(
-            name=ASSISTANT_NAME,
-            instructions=f"""
-            You are an expert in HOA documents. Accuracy is extremely important.
-            When answering, always extract information directly from the provided documents.
-            If using file search, return the most relevant sections word-for-word and cite the document name.
-            If no relevant information is found, explicitly state: 'No relevant data found in the uploaded documents.'
-            Do NOT answer from general knowledge—only use the retrieved documents.
-            
-            Use this Authority Ranking to prioritize information sources (1 is highest priority):
-            {json.dumps(AUTHORITY_RANKING, indent=2)}
-            
-            When multiple documents contain relevant information, always prioritize information from the highest-ranked source.
-            Include the source document name in your response.
-            """,
-            model=MODEL_NAME,
-            tools=[{"type": "file_search"}],
-            temperature=TEMPERATURE,
-        )
-        print(f"Created fresh assistant with ID: {assistant.id}")
+        settings = {
+            "instructions": ASSISTANT_INSTRUCTIONS,
+            "model": MODEL_NAME,
+            "tools": [{
+                "type": "file_search",
+                "file_search": {
+                    "max_num_results": FILE_SEARCH_MAX_RESULTS,
+                    "ranking_options": {"ranker": FILE_SEARCH_RANKER, "score_threshold": FILE_SEARCH_SCORE_THRESHOLD},
+                },
+            }],
+            "temperature": TEMPERATURE,
+        }
+
+        # Skip the listing entirely when a previous run recorded the ID
+        existing = None
+        cached_id = load_cached_ids().get("assistant_id")
+        if cached_id:
+            try:
+                cached = client.beta.assistants.retrieve(cached_id)
+                if cached.name == ASSISTANT_NAME:
+                    existing = cached
+            except Exception as e:
+                print(f"Could not retrieve cached assistant: {e}")
+
+        if existing is None:
+            # The auto-pager only fetches further pages until a match is found
+            existing = next((asst for asst in client.beta.assistants.list(limit=100) if asst.name == ASSISTANT_NAME), None)
+
+        if existing:
+            assistant = client.beta.assistants.update(existing.id, **settings)
+            print(f"Updated existing assistant with ID: {assistant.id}")
+        else:
+            assistant = client.beta.assistants.create(name=ASSISTANT_NAME, **settings)
+            print(f"Created fresh assistant with ID: {assistant.id}")
+
+        save_cached_id("assistant_id", assistant.id)
         return assistant
 
     except Exception as e:
@@ -211,81 +340,145 @@ def verify_assistant_setup(client: OpenAI, assistant_id: str, vector_store_id: s
     return True
 
 def create_or_retrieve_vector_store(client: OpenAI) -> any:
-    """Creates a new Vector Store or retrieves an existing one by name."""
-    try:
-        # Retrieve existing vector stores
-        vector_stores = client.beta.vector_stores.list(order="desc", order_by="created_at")
-        for vs in vector_stores.data:
-            if vs.name == VECTOR_STORE_NAME:
-                print(f"Found existing vector store with ID: {vs.id}")
-                return vs
-
-        # If no vector store with the specified name is found, create a new one
-        raise ValueError(f"No vector store found with name: {VECTOR_STORE_NAME}")
-    except Exception as e:
-        print(f"An error occurred while trying to retrieve the vector store: {e}")
-        print("Creating a new vector store...")
+    """Retrieves the Vector Store used by a previous run, finds one by name, or creates a new one."""
+    vector_store = None
+
+    # Skip the listing entirely when a previous run recorded the ID
+    cached_id = load_cached_ids().get("vector_store_id")
+    if cached_id:
+        try:
+            cached = client.beta.vector_stores.retrieve(cached_id)
+            if cached.name == VECTOR_STORE_NAME and cached.status != "expired":
+                print(f"Found cached vector store with ID: {cached.id}")
+                vector_store = cached
+        except Exception as e:
+            print(f"Could not retrieve cached vector store: {e}")
+
+    if vector_store is None:
+        try:
+            # The auto-pager only fetches further pages until a match is found
+            for vs in client.beta.vector_stores.list(limit=100):
+                if vs.name == VECTOR_STORE_NAME:
+                    print(f"Found existing vector store with ID: {vs.id}")
+                    vector_store = vs
+                    break
+        except Exception as e:
+            print(f"An error occurred while trying to retrieve the vector store: {e}")
 
+    if vector_store is None:
+        print("Creating a new vector store...")
         vector_store = client.beta.vector_stores.create(name=VECTOR_STORE_NAME)
         print(f"Vector store created with ID: {vector_store.id}")
-        return vector_store
 
-def upload_files_to_vector_store(client: OpenAI, vector_store_id: str, files_with_content: List[Dict[str, str]]) -> Dict:
-    """Uploads files to the vector store."""
-    uploaded_file_ids = []
-    fid_to_fpath = {}
-    for file_data in files_with_content:
-        try:
-            with tempfile.NamedTemporaryFile(suffix=os.path.splitext(file_data["path"])[1], delete=False) as temp_file:
-                temp_file.write(file_data["content"].encode('utf-8'))
-                temp_file_path = temp_file.name
+    save_cached_id("vector_store_id", vector_store.id)
+    return vector_store
 
-            with open(temp_file_path, "rb") as file_stream:
-                uploaded_file = client.files.create(file=file_stream, purpose="assistants")
-                uploaded_file_ids.append(uploaded_file.id)
-                fid_to_fpath[uploaded_file.id] = file_data['path']
-                print(f"Uploaded file {file_data['path']} with ID: {uploaded_file.id}")
+@functools.lru_cache(maxsize=None)
+def file_digest(file_path: str) -> str:
+    """Returns the SHA-256 hex digest of a file's contents."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
 
-        except Exception as e:
-            print(f"Error uploading {file_data['path']}: {e}")
+def load_manifest(vector_store_id: str) -> Dict[str, str]:
+    """Reads the document key -> file ID manifest recorded for this vector store by a previous run."""
+    try:
+        with open(MANIFEST_PATH) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    # A manifest written for another vector store says nothing about this one
+    return manifest.get("files", {}) if manifest.get("vector_store_id") == vector_store_id else {}
+
+def save_manifest(vector_store_id: str, files: Dict[str, str]) -> None:
+    """Records which file ID holds each document's content in the vector store."""
+    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+    with open(MANIFEST_PATH, "w") as f:
+        json.dump({"vector_store_id": vector_store_id, "files": files}, f, indent=2)
+
+def manifest_key(file_path: str) -> str:
+    """Identifies a document by filename as well as content.
+
+    File Search labels chunks with the filename given at upload, so a renamed document must be
+    re-uploaded for its authority rank to apply; two files with identical content stay separate too.
+    """
+    return f"{os.path.basename(file_path)}:{file_digest(file_path)}"
+
+def upload_file(client: OpenAI, file_path: str) -> Optional[str]:
+    """Uploads one document for use with File Search and returns its file ID, or None if the upload failed."""
+    try:
+        return client.files.create(file=Path(file_path), purpose="assistants").id
+    except Exception as e:
+        print(f"Error uploading {file_path}: {e}")
+        return None
+
+def upload_files_to_vector_store(client: OpenAI, vector_store_id: str, file_paths: List[str]) -> Dict:
+    """Syncs the vector store with the documents, uploading only files whose content is new."""
+    manifest = load_manifest(vector_store_id)
+    stored_files = {
+        vs_file.id: vs_file.status
+        for vs_file in client.beta.vector_stores.files.list(vector_store_id=vector_store_id, limit=100)
+    }
+
+    # Reuse uploads of unchanged documents that the vector store still holds
+    fid_to_fpath = {}
+    new_file_paths = []
+    for file_path in file_paths:
+        file_id = manifest.get(manifest_key(file_path))
+        if file_id and stored_files.get(file_id) == "completed":
+            fid_to_fpath[file_id] = file_path
+            print(f"Unchanged file {file_path} already uploaded with ID: {file_id}")
+        else:
+            new_file_paths.append(file_path)
 
-        finally:
-            if 'temp_file_path' in locals():
-                os.remove(temp_file_path)
+    # Upload the original files on a small thread pool; File Search parses PDF/Word/text natively.
+    # files.create returns each ID directly, so no listing is needed to map IDs back to paths.
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_UPLOADS) as executor:
+        uploads = list(zip(executor.map(functools.partial(upload_file, client), new_file_paths), new_file_paths))
+    uploads = [(file_id, file_path) for file_id, file_path in uploads if file_id]  # Failed uploads are skipped
+    new_file_ids = [file_id for file_id, _ in uploads]
 
-    if uploaded_file_ids:
-        file_batch_attachment = client.beta.vector_stores.file_batches.create(
+    for start in range(0, len(new_file_ids), FILE_BATCH_LIMIT):
+        file_batch = client.beta.vector_stores.file_batches.create_and_poll(
             vector_store_id=vector_store_id,
-            file_ids=uploaded_file_ids
+            file_ids=new_file_ids[start:start + FILE_BATCH_LIMIT],
+            poll_interval_ms=FILE_BATCH_POLL_INTERVAL_MS,
         )
 
-        # Wait for file processing to complete
-        while True:
-            file_batch_attachment = client.beta.vector_stores.file_batches.retrieve(
-                vector_store_id=vector_store_id,
-                batch_id=file_batch_attachment.id
-            )
-
-            if file_batch_attachment.status == "completed":
-                print("File batch processing completed.")
-                break
-            elif file_batch_attachment.status == "failed":
-                print("File batch processing failed.")
-                exit(1)
-            print("Waiting for file batch processing...")
-            time.sleep(5)
-
-        print(f"File batch explicitly added to vector store. Status: {file_batch_attachment.status}")
-    else:
+        if file_batch.status != "completed":
+            print(f"File batch processing failed. Status: {file_batch.status}")
+            exit(1)
+        print(f"File batch explicitly added to vector store. File counts: {file_batch.file_counts}")
+
+    for file_id, file_path in uploads:
+        fid_to_fpath[file_id] = file_path
+        print(f"Uploaded file {file_path} with ID: {file_id}")
+
+    if not fid_to_fpath:
         print("No files were successfully uploaded.")
         exit(1)
-    
+
+    # Remove files from earlier runs whose content is no longer among the documents. Detaching
+    # alone would leave the uploaded File object behind in storage, so delete that as well.
+    for file_id in stored_files:
+        if file_id not in fid_to_fpath:
+            client.beta.vector_stores.files.delete(file_id=file_id, vector_store_id=vector_store_id)
+            try:
+                client.files.delete(file_id)
+            except NotFoundError:
+                pass  # Already deleted elsewhere
+            print(f"Deleted stale file {file_id} from the vector store and file storage")
+
+    save_manifest(vector_store_id, {manifest_key(file_path): file_id for file_id, file_path in fid_to_fpath.items()})
     return fid_to_fpath
 
-def update_assistant(client: OpenAI, assistant_id: str, vector_store_id: str) -> None:
-    """Updates the Assistant to use the Vector Store."""
+def update_assistant(client: OpenAI, assistant_id: str, vector_store_id: str, file_paths: List[str]) -> None:
+    """Updates the Assistant to use the Vector Store and tells it the authority rank of each uploaded file."""
     assistant = client.beta.assistants.update(
         assistant_id=assistant_id,
+        instructions=assistant_instructions(file_paths),
         tool_resources={"file_search": {"vector_store_ids": [vector_store_id]}}
     )
     print("Assistant updated to use vector store.")
@@ -299,112 +492,185 @@ def update_assistant(client: OpenAI, assistant_id: str, vector_store_id: str) ->
     else:
         print("✅ Assistant is correctly linked to vector store:", assistant.tool_resources.file_search.vector_store_ids)
 
-def ask_question(client: OpenAI, assistant_id: str, question: str) -> Dict[str, str]:
-    """Vector store-enabled question handler"""
+def failed_response(question: str, answer: str, summary: str) -> Dict[str, str]:
+    """Builds the response entry recorded for a question that could not be answered."""
+    return {
+        "question": question,
+        "answer": answer,
+        "summary": summary,
+        "source": "N/A",
+        "source_citations": [],
+        "answered": False,
+    }
+
+async def ask_question_batch(aclient: AsyncOpenAI, assistant_id: str, thread_id: str, questions: List[str]) -> List[Optional[Dict[str, str]]]:
+    """Vector store-enabled handler that answers several questions in one run on an existing thread.
+
+    A question whose answer has no section of its own in the reply comes back as None.
+    """
     try:
-        # Create new thread
-        thread = client.beta.threads.create()
-        
-        # Add the question
-        client.beta.threads.messages.create(
-            thread_id=thread.id,
+        # Add the questions, numbered so the answer can be split back up
+        numbered_questions = "\n\n".join(f"QUESTION {idx}: {question}" for idx, question in enumerate(questions, 1))
+        await aclient.beta.threads.messages.create(
+            thread_id=thread_id,
             role="user",
-            content=f"Search the documents and answer: {question}"
+            content=f"Search the documents and answer each of the following questions:\n\n{numbered_questions}"
         )
         
-        # Create run with file search enabled
-        run = client.beta.threads.runs.create(
-            thread_id=thread.id,
+        # Create run with file search enabled and stream it to completion. All static
+        # instructions live on the assistant so every run shares the same cacheable prefix.
+        handler = await stream_run(
+            aclient,
+            thread_id=thread_id,
             assistant_id=assistant_id,
-            instructions="""
-            Please address the user as Corbin. The user has a premium account. 
-            Use file search to find relevant information.
-            Prioritize extracting information from the highest-ranked document according to the Authority Ranking.
-            Provide both a detailed answer and a brief summary.
-            Be extremely accurate.
-            Format the response as:
-            DETAILED ANSWER:
-            [Your detailed response here]
-
-            SUMMARY:
-            [Your brief summary here]
-            """
         )
         
-        # Wait for processing
-        while True:
-            run_status = client.beta.threads.runs.retrieve(
-                thread_id=thread.id,
-                run_id=run.id
-            )
-            
-            if run_status.status == 'completed':
-                # Get response with citations
-                messages = client.beta.threads.messages.list(
-                    thread_id=thread.id,
-                    order="desc",
-                    limit=1
-                )
-                
-                response = messages.data[0].content[0].text.value
-                sources = []
-                source_citations = []
-                
-                # Extract file citations
-                for content in messages.data[0].content:
-                    if hasattr(content, 'text'):
-                        for annotation in content.text.annotations:
-                            if annotation.type == 'file_citation':
-                                file = client.files.retrieve(annotation.file_citation.file_id)
-                                sources.append(file.filename)
-                                source_citations.append(annotation.to_dict())
-
-                # Parse response sections
-                parts = response.split("SUMMARY:")
-                detailed = parts[0].replace("DETAILED ANSWER:", "").strip()
-                summary = parts[1].strip() if len(parts) > 1 else detailed[:200]
-                
-                return {
-                    "question": question,
-                    "answer": detailed,
-                    "summary": summary,
-                    "source": ", ".join(set(sources)) if sources else "No specific sources cited",
-                    "source_citations": source_citations,
-                }
+        run = handler.current_run
+        if run is None or run.status != 'completed':
+            status = run.status if run else "no run"
+            return [failed_response(question, f"Search failed: {status}", "Document search error") for question in questions]
+
+        # The streamed reply already carries the text and citations, so no messages.list is needed
+        reply = handler.final_message
+        if reply is None:
+            return [failed_response(question, "No answer returned for this question.", "Document search error") for question in questions]
+
+        response = reply.content[0].text.value
+
+        # Locate each question's section of the response
+        # Headers must count upwards through the batch. A number used by more than one header means
+        # some answer's text looks like a header, so no split can be trusted and every question is re-asked.
+        markers = [(int(marker.group(1)), marker) for marker in QUESTION_MARKER.finditer(response)]
+        markers = [(idx, marker) for idx, marker in markers if 1 <= idx <= len(questions)]
+        numbers = [idx for idx, _ in markers]
+        sections = {}
+        if numbers == sorted(set(numbers)):
+            for (idx, marker), next_marker in zip(markers, markers[1:] + [None]):
+                end = next_marker[1].start() if next_marker else len(response)
+                sections[idx] = (marker.end(), end)
+        if len(questions) == 1 and 1 not in sections:
+            sections = {1: (0, len(response))}
+
+        sources: Dict[int, set] = {idx: set() for idx in sections}
+        source_citations = {idx: [] for idx in sections}
+        cited_file_ids = {idx: set() for idx in sections}
+        
+        # Extract file citations, attributing each to the section it appears in
+        for content in reply.content:
+            if hasattr(content, 'text'):
+                for annotation in content.text.annotations:
+                    if annotation.type == 'file_citation':
+                        idx = next((idx for idx, (start, end) in sections.items() if start <= annotation.start_index < end), None)
+                        if idx is None:
+                            continue
+                        source_citations[idx].append(annotation.to_dict())
+
+                        # Resolve each cited file once per answer
+                        file_id = annotation.file_citation.file_id
+                        if file_id in cited_file_ids[idx]:
+                            continue
+                        cited_file_ids[idx].add(file_id)
+                        sources[idx].add(await filename_for(aclient, file_id))
+
+        results = []
+        for idx, question in enumerate(questions, 1):
+            if idx not in sections:
+                results.append(None)
+                continue
+
+            # Parse response sections; each section already ends at the next question's marker
+            start, end = sections[idx]
+            parts = SUMMARY_MARKER.split(response[start:end], maxsplit=1)
+            detailed = DETAILED_MARKER.sub("", parts[0], count=1).strip()
+            summary = parts[1].strip() if len(parts) > 1 else detailed[:200]
             
-            if run_status.status in ['failed', 'cancelled', 'expired']:
-                return {
-                    "question": question,
-                    "answer": f"Search failed: {run_status.status}",
-                    "summary": "Document search error",
-                    "source": "N/A",
-                    "source_citations": [],
-                }
-                
-            time.sleep(1)
+            results.append({
+                "question": question,
+                "answer": detailed,
+                "summary": summary,
+                "source": ", ".join(sorted(sources[idx])) if sources[idx] else "No specific sources cited",
+                "source_citations": source_citations[idx],
+                "answered": True,  # Parsed from this question's own section of the reply
+            })
+
+        return results
             
     except Exception as e:
         print(f"Error: {e}")
-        return {
-            "question": question,
-            "answer": str(e),
-            "summary": "Processing error",
-            "source": "N/A",
-            "source_citations": []
-        }
+        return [failed_response(question, str(e), "Processing error") for question in questions]
+
+async def ask_questions(aclient: AsyncOpenAI, assistant_id: str, questions: List[str]) -> List[Dict[str, str]]:
+    """Concurrent question processor; results are returned in question order.
+
+    Questions are answered QUESTIONS_PER_RUN at a time, so related questions share one retrieval
+    pass. A small pool of threads is shared by all batches. A thread allows only one active
+    run at a time, so the pool size also bounds how many runs are in flight.
+    """
+    batches = [questions[start:start + QUESTIONS_PER_RUN] for start in range(0, len(questions), QUESTIONS_PER_RUN)]
+    pool_size = min(MAX_CONCURRENT_RUNS, len(batches))
+    threads = await asyncio.gather(*(aclient.beta.threads.create() for _ in range(pool_size)))
+    thread_pool = asyncio.Queue()
+    for thread in threads:
+        thread_pool.put_nowait(thread.id)
+
+    async def bounded(first_idx: int, batch: List[str]) -> List[Dict[str, str]]:
+        thread_id = await thread_pool.get()  # Wait for a free thread; also prevents rate limiting
+        try:
+            print(f"\nProcessing questions {first_idx}-{first_idx + len(batch) - 1}/{len(questions)}")
+            results = await ask_question_batch(aclient, assistant_id, thread_id, batch)
+            for offset, result in enumerate(results):
+                if result is None:
+                    # The reply skipped or merged this question's section, so ask it again on its own
+                    print(f"Re-asking question {first_idx + offset} on its own")
+                    results[offset] = (await ask_question_batch(aclient, assistant_id, thread_id, [batch[offset]]))[0]
+            return results
+        finally:
+            thread_pool.put_nowait(thread_id)
 
-def ask_questions(client: OpenAI, assistant_id: str, questions: List[str]) -> List[Dict[str, str]]:
-    """Sequential question processor"""
-    results = []
-    
-    for idx, question in enumerate(questions, 1):
-        print(f"\nProcessing question {idx}/{len(questions)}")
-        result = ask_question(client, assistant_id, question)
-        results.append(result)
-        time.sleep(2)  # Prevent rate limiting
-        
-    return results
+    tasks = [bounded(start + 1, batch) for start, batch in zip(range(0, len(questions), QUESTIONS_PER_RUN), batches)]
+    return [result for batch_results in await asyncio.gather(*tasks) for result in batch_results]
+
+
+
+def response_cache_key(question: str, documents: List[str], instructions: str) -> str:
+    """Keys a cached response on everything that shapes the answer: question, documents, model, prompt and retrieval settings."""
+    retrieval_settings = [QUESTIONS_PER_RUN, FILE_SEARCH_MAX_RESULTS, FILE_SEARCH_RANKER, FILE_SEARCH_SCORE_THRESHOLD]
+    key_material = "\n".join([question, *sorted(documents), MODEL_NAME, str(TEMPERATURE), *map(str, retrieval_settings), instructions])
+    return hashlib.sha256(key_material.encode("utf-8")).hexdigest()
+
+def answer_questions(aclient: AsyncOpenAI, assistant_id: str, questions: List[str], file_paths: List[str]) -> List[Dict[str, str]]:
+    """Answers the questions, reusing responses cached by earlier runs over the same documents."""
+    # Filenames matter as well as contents: they are cited as sources and decide each document's authority rank
+    documents = [f"{os.path.basename(file_path)}:{file_digest(file_path)}" for file_path in file_paths]
+    instructions = assistant_instructions(file_paths)
+    cache_keys = {question: response_cache_key(question, documents, instructions) for question in questions}
+
+    Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+    cache = sqlite3.connect(RESPONSE_CACHE_PATH)
+    try:
+        cache.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response BLOB NOT NULL)")
+
+        responses = {}
+        for question, key in cache_keys.items():
+            row = cache.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row:
+                responses[question] = orjson.loads(row[0])
+
+        missing = [question for question in questions if question not in responses]
+        print(f"\nReusing {len(responses)} cached answers; asking {len(missing)} questions.")
+        if missing:
+            for response in asyncio.run(ask_questions(aclient, assistant_id, missing)):
+                responses[response["question"]] = response
+                if response["answered"]:  # Errors and unparsed replies are asked again next run
+                    cache.execute(
+                        "INSERT OR REPLACE INTO responses (key, response) VALUES (?, ?)",
+                        (cache_keys[response["question"]], orjson.dumps(response)),
+                    )
+            cache.commit()
+    finally:
+        cache.close()
 
+    return [responses[question] for question in questions]
 
 
 def create_summary_table(fid_to_fpath: Dict[str, str], responses: List[Dict[str, str]]) -> List[Dict[str, str]]:
@@ -418,14 +684,15 @@ def create_summary_table(fid_to_fpath: Dict[str, str], responses: List[Dict[str,
         "Routine Maintenance", "Dispute Resolution", "Insurance Policies", "Legal Issues", "Resident Engagement"
     ]
 
-    for i, category in enumerate(categories):
-        response = next((r for r in responses if r["question"].startswith(EXTRACTION_QUESTIONS[i][:50])), None)
+    responses_by_question = {r["question"]: r for r in responses}
+    for category, question in zip(categories, EXTRACTION_QUESTIONS):
+        response = responses_by_question.get(question)
 
         if response:
             summary_table.append({
                 "Category": category,
-                "Findings": response["summary"] ,
-                "Source": response["source_citations"]
+                "Findings": response["summary"],
+                "Source": response["source"]
             })
         else:
             summary_table.append({"Category": category, "Findings": "No information found.", "Source": "N/A"})
@@ -437,40 +704,40 @@ def main():
     """Main function to orchestrate the process."""
     try:
         # 1. Prepare Files
-        files_with_content = prepare_files(HOA_DOCS_DIR)
+        file_paths = prepare_files(HOA_DOCS_DIR)
 
         # 2. Create or Retrieve Assistant and Vector Store
         assistant = create_or_update_assistant(client)
         vector_store = create_or_retrieve_vector_store(client)
 
         # 3. Upload and process files
-        fid_to_fpath = upload_files_to_vector_store(client, vector_store.id, files_with_content)
-        update_assistant(client, assistant.id, vector_store.id)
+        fid_to_fpath = upload_files_to_vector_store(client, vector_store.id, file_paths)
+        FILENAME_CACHE.update({fid: os.path.basename(fpath) for fid, fpath in fid_to_fpath.items()})
+        uploaded_paths = list(fid_to_fpath.values())
+        update_assistant(client, assistant.id, vector_store.id, uploaded_paths)
         
         # 4. Verify setup before proceeding
         if not verify_assistant_setup(client, assistant.id, vector_store.id):
             raise Exception("Assistant setup verification failed")
         
         # 5. Ask Questions
-        responses = ask_questions(client, assistant.id, EXTRACTION_QUESTIONS)
+        responses = answer_questions(aclient, assistant.id, EXTRACTION_QUESTIONS, uploaded_paths)
         
         # 6. Create Summary Table
         summary_table = create_summary_table(fid_to_fpath, responses)
         
         # 7. Output JSON
-        if not os.path.exists(OUTPUT_DIR):
-            os.makedirs(OUTPUT_DIR, exist_ok=True)
+        Path(OUTPUT_DIR).mkdir(parents=True, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H-%M-%S")  # Shared so both files of a run match
 
         print("\nSaving JSON Summary Table...")
-        summary_fname = os.path.join(OUTPUT_DIR, "{}-summary.json".format(datetime.now().strftime("%Y-%m-%d %H-%M-%S")))
-        with open(summary_fname, "w") as s_f:
-            json.dump(summary_table, s_f, indent=4)
+        summary_fname = Path(OUTPUT_DIR) / f"{timestamp}-summary.json"
+        summary_fname.write_bytes(orjson.dumps(summary_table, option=orjson.OPT_INDENT_2))
         print("\nSummary Table saved as:", summary_fname)
 
         print("\nSaving JSON Answer Table...")
-        answers_fname = os.path.join(OUTPUT_DIR, "{}-answers.json".format(datetime.now().strftime("%Y-%m-%d %H-%M-%S")))
-        with open(answers_fname, "w") as a_f:
-            json.dump(responses, a_f, indent=4)
+        answers_fname = Path(OUTPUT_DIR) / f"{timestamp}-answers.json"
+        answers_fname.write_bytes(orjson.dumps(responses, option=orjson.OPT_INDENT_2))
         print("Answers saved as:", answers_fname)
 
     except Exception as e: